@@ -23,46 +23,72 @@ gre_model = genanki.Model(
     ],
 )
 
-# Create a unique deck ID
-deck_id = random.randrange(1 << 30, 1 << 31)
-
-# Create a new deck
-deck = genanki.Deck(deck_id, "GRE Vocabulary")
-
-# Read the Excel file
-df = pd.read_excel("data/3000.xlsx")
 
-# Process each word and add to the deck
-for _, row in df.iterrows():
-    # Skip rows with missing Word
-    if pd.isna(row["Word"]):
-        continue
+class LazyDeck(genanki.Deck):
+    """Deck whose notes are generated on demand from word/details columns.
 
-    # Create the answer string with all the additional information
-    details = ""
+    The column notes are never stored on the deck: they are built one at a
+    time and written straight to the collection, so a single Note is alive at
+    once and each is constructed exactly once. Notes added with ``add_note``
+    are written as usual.
+    """
 
-    if not pd.isna(row["UK Phonetics"]):
-        details += f"<div><b>UK Phonetics:</b> {row['UK Phonetics']}</div>"
+    def __init__(self, deck_id, name, words, details):
+        super().__init__(deck_id, name)
+        self.words = words
+        self.details = details
+        # genanki registers models by scanning deck.notes, which the column
+        # notes are not part of
+        self.add_model(gre_model)
 
-    if not pd.isna(row["US Phonetics"]):
-        details += f"<div><b>US Phonetics:</b> {row['US Phonetics']}</div>"
+    def write_to_db(self, cursor, timestamp, id_gen):
+        # Writes the deck, its models and any explicitly added notes
+        super().write_to_db(cursor, timestamp, id_gen)
+        for word, details in zip(self.words, self.details):
+            note = genanki.Note(model=gre_model, fields=[word, details])
+            note.write_to_db(cursor, timestamp, self.deck_id, id_gen)
 
-    if not pd.isna(row["Paraphrase"]):
-        details += f"<div><b>Paraphrase:</b> {row['Paraphrase']}</div>"
 
-    if not pd.isna(row["Paraphrase (w/ POS)"]):
-        details += (
-            f"<div><b>Paraphrase (w/ POS):</b> {row['Paraphrase (w/ POS)']}</div>"
-        )
-
-    if not pd.isna(row["Paraphrase (English)"]):
-        details += (
-            f"<div><b>Paraphrase (English):</b> {row['Paraphrase (English)']}</div>"
-        )
+# Create a unique deck ID
+deck_id = random.randrange(1 << 30, 1 << 31)
 
-    # Create a note and add it to the deck
-    note = genanki.Note(model=gre_model, fields=[str(row["Word"]), details])
-    deck.add_note(note)
+# Only these columns are used to build the cards
+COLUMNS = [
+    "Word",
+    "UK Phonetics",
+    "US Phonetics",
+    "Paraphrase",
+    "Paraphrase (w/ POS)",
+    "Paraphrase (English)",
+]
+
+EXCEL_PATH = "data/3000.xlsx"
+PARQUET_PATH = "data/3000.parquet"
+
+# Reuse the Parquet copy of the sheet if it is newer than the Excel file
+if (
+    os.path.exists(PARQUET_PATH)
+    and os.path.getmtime(PARQUET_PATH) >= os.path.getmtime(EXCEL_PATH)
+):
+    df = pd.read_parquet(PARQUET_PATH, engine="pyarrow")
+else:
+    # Read the Excel file with the Rust-backed calamine engine, dropping rows
+    # with missing Word and blanking other NAs. Everything is cast to str so
+    # mixed-type columns can be written to Parquet.
+    df = pd.read_excel(EXCEL_PATH, engine="calamine", usecols=COLUMNS)
+    df = df.dropna(subset=["Word"]).fillna("").astype(str)
+    df.to_parquet(PARQUET_PATH, engine="pyarrow", index=False)
+
+# Build the answer HTML for every row at once, one column at a time
+df["details"] = ""
+for column in COLUMNS[1:]:
+    mask = df[column] != ""
+    df.loc[mask, "details"] += f"<div><b>{column}:</b> " + df.loc[mask, column] + "</div>"
+
+# Create a new deck that builds its notes while the package is written
+deck = LazyDeck(
+    deck_id, "GRE Vocabulary", df["Word"].to_numpy(), df["details"].to_numpy()
+)
 
 # Create output directory if it doesn't exist
 os.makedirs("out", exist_ok=True)
@@ -72,5 +98,5 @@ package = genanki.Package(deck)
 package.write_to_file("out/gre_vocabulary.apkg")
 
 print(
-    f"Successfully created Anki deck with {len(deck.notes)} cards in out/gre_vocabulary.apkg"
+    f"Successfully created Anki deck with {len(df)} cards in out/gre_vocabulary.apkg"
 )
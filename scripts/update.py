@@ -1,20 +1,41 @@
 #!/usr/bin/env python3
 
-import json
-import re
+import aiohttp
+import asyncio
+import orjson
 import requests
+import sqlite3
 import sys
-from typing import Dict, List, Optional
+import time
+from typing import Dict, List, Optional, Tuple
 
 # Configuration
 ANKI_CONNECT_URL = "http://localhost:8765"
 DECK_NAME = "GRE Vocabulary"
 CAMBRIDGE_API_URL = "https://dict.meowrain.cn/api/dictionary/en-cn/"
+UPDATE_BATCH_SIZE = 50
+FETCH_CONCURRENCY = 50
+CACHE_PATH = "data/dict_cache.db"
+CACHE_TTL = 30 * 24 * 60 * 60  # seconds to trust a cached definition
+NEGATIVE_CACHE_TTL = 24 * 60 * 60  # shorter TTL for words the API had no entry for
+
+# Parts of speech in output order, and the API's pos mapped to their index
+POS_LABELS = ("Verb", "Noun", "Adjective", "Adverb")
+POS_INDEX = {"verb": 0, "noun": 1, "adjective": 2, "adverb": 3}
+
+# Fixed HTML fragments shared by every formatted definition
+DEFINITIONS_HEADER = "<hr><div><b>Definitions:</b></div>"
+EXAMPLES_HEADER = "<div style='margin-left: 40px'><i>Examples:</i></div>"
+FOOTER = "<div style='margin-left: 20px'>- Sentences:</div>\n<div style='margin-left: 20px'>- Synonyms:</div>"
+POS_TEMPLATE = "\n<div>{idx}. <b>{pos}:</b></div>\n{defs}\n" + FOOTER
+
+# Shared session so every AnkiConnect call reuses one keep-alive connection
+session = requests.Session()
 
 def check_anki_connect() -> bool:
     """Check if AnkiConnect is available and running."""
     try:
-        response = requests.post(ANKI_CONNECT_URL, json={
+        response = session.post(ANKI_CONNECT_URL, json={
             "action": "version",
             "version": 6
         })
@@ -22,122 +43,190 @@ def check_anki_connect() -> bool:
     except requests.exceptions.RequestException:
         return False
 
-def get_deck_names() -> List[str]:
-    """Get all deck names from Anki."""
-    response = requests.post(ANKI_CONNECT_URL, json={
-        "action": "deckNames",
-        "version": 6
+def anki_multi(actions: List[Dict]) -> Optional[List[Dict]]:
+    """Run several AnkiConnect actions in a single request. Returns None on HTTP failure."""
+    response = session.post(ANKI_CONNECT_URL, json={
+        "action": "multi",
+        "version": 6,
+        "params": {
+            "actions": [{"version": 6, **action} for action in actions]
+        }
     })
-    if response.ok:
-        return response.json()["result"]
-    return []
+    if not response.ok or response.json()["error"]:
+        print(f"Error response from multi: {response.text}")
+        return None
+    return response.json()["result"]
+
+def open_cache(path: str = CACHE_PATH) -> sqlite3.Connection:
+    """Open (and create if needed) the on-disk dictionary response cache."""
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS dict_cache ("
+        "word TEXT PRIMARY KEY, json TEXT, fetched_at INTEGER)"
+    )
+    return conn
+
+def cache_lookup(cache: sqlite3.Connection, word: str) -> Tuple[bool, Optional[Dict]]:
+    """Return (hit, response) for a word. Negative entries are stored as NULL json."""
+    row = cache.execute(
+        "SELECT json, fetched_at FROM dict_cache WHERE word = ?", (word,)
+    ).fetchone()
+    if row is None:
+        return False, None
+    payload, fetched_at = row
+    ttl = CACHE_TTL if payload is not None else NEGATIVE_CACHE_TTL
+    if time.time() - fetched_at > ttl:
+        return False, None
+    if payload is None:
+        return True, None
+    try:
+        return True, orjson.loads(payload)
+    except orjson.JSONDecodeError:
+        # Treat an unreadable entry as a miss so it is fetched again
+        return False, None
+
+def cache_store(cache: sqlite3.Connection, word: str, payload: Optional[str]) -> None:
+    """Insert or refresh a cache entry. A None payload records a negative result.
+
+    The caller commits, so a run does not block on a disk write per word.
+    """
+    cache.execute(
+        "INSERT OR REPLACE INTO dict_cache (word, json, fetched_at) VALUES (?, ?, ?)",
+        (word, payload, int(time.time()))
+    )
+
+async def get_cambridge_definition(http: aiohttp.ClientSession, cache: sqlite3.Connection, word: str) -> Optional[Dict]:
+    """Get word definition from the cache, falling back to the Cambridge Dictionary API."""
+    hit, cached = cache_lookup(cache, word)
+    if hit:
+        return cached
 
-def get_cambridge_definition(word: str) -> Optional[Dict]:
-    """Get word definition from Cambridge Dictionary API."""
     try:
-        response = requests.get(f"{CAMBRIDGE_API_URL}{word}")
-        if response.ok:
-            return response.json()
-        else:
-            print(f"Warning: Failed to get definition for word '{word}'. Status code: {response.status_code}")
-            return None
-    except requests.exceptions.RequestException as e:
+        async with http.get(f"{CAMBRIDGE_API_URL}{word}") as response:
+            if response.ok:
+                payload = await response.read()
+                try:
+                    result = orjson.loads(payload)
+                except orjson.JSONDecodeError as e:
+                    print(f"Warning: Invalid JSON in definition for word '{word}': {str(e)}")
+                    return None
+                if not isinstance(result, dict) or not result.get("definition"):
+                    # The API knows nothing about this word; remember that briefly
+                    cache_store(cache, word, None)
+                    return None
+                cache_store(cache, word, payload.decode("utf-8"))
+                return result
+            else:
+                print(f"Warning: Failed to get definition for word '{word}'. Status code: {response.status}")
+                # Only a 404 means the word has no entry; rate limits and server
+                # errors are retried next run
+                if response.status == 404:
+                    cache_store(cache, word, None)
+                return None
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        # Transport, timeout and decode errors are not cached so the word is
+        # retried next run, and one bad response cannot abort the whole gather
         print(f"Warning: API request failed for word '{word}': {str(e)}")
         return None
 
+async def fetch_definitions(words: List[str]) -> List[Optional[Dict]]:
+    """Fetch definitions for the given (distinct) words concurrently, preserving input order."""
+    semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+    cache = open_cache()
+
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=100)) as http:
+            async def sem_fetch(word: str) -> Optional[Dict]:
+                async with semaphore:
+                    return await get_cambridge_definition(http, cache, word)
+
+            return await asyncio.gather(*[sem_fetch(word) for word in words])
+    finally:
+        cache.commit()
+        cache.close()
+
+def format_examples(examples: List[str]) -> str:
+    """Format the numbered examples of a single definition."""
+    return EXAMPLES_HEADER + "\n" + "\n".join(
+        f"<div style='margin-left: 40px'>{ex_idx}. {example}</div>"
+        for ex_idx, example in enumerate(examples, 1)
+    )
+
 def format_definition(word: str, api_response: Optional[Dict]) -> Optional[str]:
     """Format the definition according to the specified template. Returns None if no valid definitions found."""
     if not api_response:
         return None
     
-    # Initialize sections for each part of speech
-    sections = {
-        "Verb": [],
-        "Noun": [],
-        "Adjective": [],
-        "Adverb": []
-    }
-    
-    # Map API's pos to our categories
-    pos_mapping = {
-        "verb": "Verb",
-        "noun": "Noun",
-        "adjective": "Adjective",
-        "adverb": "Adverb"
-    }
+    # Bin definitions by part of speech, in output order
+    buckets = [[] for _ in POS_LABELS]
     
     # Process definitions
     has_valid_definitions = False
     for entry in api_response.get("definition", []):
-        pos = entry.get("pos", "").lower()
-        if pos in pos_mapping:
-            category = pos_mapping[pos]
+        pos_idx = POS_INDEX.get(entry.get("pos", "").lower())
+        if pos_idx is not None:
             definition = entry.get("text", "").strip()
-            examples = [ex.get("text", "") for ex in entry.get("example", [])]
             if definition:  # Only add if there's a definition
                 has_valid_definitions = True
-                sections[category].append({
-                    "definition": definition,
-                    "examples": examples
-                })
+                examples = [ex.get("text", "") for ex in entry.get("example", [])]
+                buckets[pos_idx].append((definition, examples))
     
     if not has_valid_definitions:
         return None
 
-    # Format the output with HTML
-    output = ["<hr><div><b>Definitions:</b></div>"]
+    # Format the output with HTML, one block per part of speech
+    blocks = [DEFINITIONS_HEADER]
     
-    for idx, (pos, definitions) in enumerate(sections.items(), 1):
+    for idx, (pos, definitions) in enumerate(zip(POS_LABELS, buckets), 1):
         if not definitions:  # Skip empty sections
             continue
-            
-        # Add the part of speech header
-        output.append(f"\n<div>{idx}. <b>{pos}:</b></div>")
         
-        # Add each definition with its examples
-        for def_idx, def_data in enumerate(definitions, 1):
-            output.append(f"<div style='margin-left: 20px'>{def_idx}. {def_data['definition']}</div>")
-            if def_data['examples']:
-                output.append("<div style='margin-left: 40px'><i>Examples:</i></div>")
-                for ex_idx, example in enumerate(def_data['examples'], 1):
-                    output.append(f"<div style='margin-left: 40px'>{ex_idx}. {example}</div>")
-        
-        # Add sentences and synonyms sections
-        output.append("<div style='margin-left: 20px'>- Sentences:</div>")
-        output.append("<div style='margin-left: 20px'>- Synonyms:</div>")
+        # Each definition followed by its examples, filled into the POS template
+        defs = "\n".join(
+            f"<div style='margin-left: 20px'>{def_idx}. {definition}</div>"
+            + (f"\n{format_examples(examples)}" if examples else "")
+            for def_idx, (definition, examples) in enumerate(definitions, 1)
+        )
+        blocks.append(POS_TEMPLATE.format(idx=idx, pos=pos, defs=defs))
     
-    return "\n".join(output)
+    return "\n".join(blocks)
 
 def get_cards_to_update() -> List[Dict]:
     """Get all cards from the deck that need updating."""
-    # First, get all deck names and print them
-    deck_names = get_deck_names()
+    # Fetch the version, deck names and note ids in one round-trip. The second
+    # findNotes lets Anki pick out already formatted notes so their fields
+    # never have to be transferred.
+    results = anki_multi([
+        {"action": "version"},
+        {"action": "deckNames"},
+        {"action": "findNotes", "params": {"query": f'deck:"{DECK_NAME}"'}},
+        {"action": "findNotes", "params": {"query": f'deck:"{DECK_NAME}" Details:*Definitions:*'}}
+    ])
+    if results is None:
+        raise Exception("Failed to get notes from Anki")
+    version, deck_names, find_notes, find_formatted = results
+
+    print(f"\nAnkiConnect version: {version['result']}")
     print("\nAvailable decks:")
-    for deck in deck_names:
+    for deck in deck_names["result"] or []:
         print(f"- '{deck}'")
     print(f"\nLooking for deck: '{DECK_NAME}'")
 
-    # Get all notes from the deck
-    response = requests.post(ANKI_CONNECT_URL, json={
-        "action": "findNotes",
-        "version": 6,
-        "params": {
-            "query": f'deck:"{DECK_NAME}"'
-        }
-    })
-    
-    if not response.ok:
-        print(f"Error response from findNotes: {response.text}")
-        raise Exception("Failed to get notes from Anki")
-    
-    note_ids = response.json()["result"]
-    print(f"\nFound {len(note_ids)} total notes in the deck")
+    for found in (find_notes, find_formatted):
+        if found["error"]:
+            print(f"Error response from findNotes: {found['error']}")
+            raise Exception("Failed to get notes from Anki")
+
+    formatted_ids = set(find_formatted["result"])
+    note_ids = [note_id for note_id in find_notes["result"] if note_id not in formatted_ids]
+    print(f"\nFound {len(find_notes['result'])} total notes in the deck, "
+          f"{len(formatted_ids)} already formatted")
     
     if not note_ids:
         return []
 
     # Get note info
-    response = requests.post(ANKI_CONNECT_URL, json={
+    response = session.post(ANKI_CONNECT_URL, json={
         "action": "notesInfo",
         "version": 6,
         "params": {
@@ -157,28 +246,32 @@ def get_cards_to_update() -> List[Dict]:
         for field_name, field_data in notes[0]["fields"].items():
             print(f"- {field_name}: {field_data['value'][:50]}...")
     
-    # Filter notes that don't already have the desired format
-    pattern = re.compile(r".*Definitions:.*", re.DOTALL)
-    filtered_notes = [note for note in notes if not pattern.match(note["fields"]["Details"]["value"])]
+    # Filter notes that don't already have the desired format (guards against
+    # anything the server-side search missed)
+    filtered_notes = [note for note in notes if "Definitions:" not in note["fields"]["Details"]["value"]]
     
     print(f"\nFiltered to {len(filtered_notes)} notes that need updating")
     return filtered_notes
 
-def update_card(note_id: int, existing_content: str, new_content: str) -> bool:
-    """Update a single card by appending new content to existing content."""
-    response = requests.post(ANKI_CONNECT_URL, json={
-        "action": "updateNoteFields",
-        "version": 6,
-        "params": {
-            "note": {
-                "id": note_id,
-                "fields": {
-                    "Details": existing_content + new_content
+def update_cards(updates: List[Tuple[int, str]]) -> List[bool]:
+    """Replace the Details field of several cards in a single multi request."""
+    results = anki_multi([
+        {
+            "action": "updateNoteFields",
+            "params": {
+                "note": {
+                    "id": note_id,
+                    "fields": {
+                        "Details": details
+                    }
                 }
             }
         }
-    })
-    return response.ok
+        for note_id, details in updates
+    ])
+    if results is None:
+        return [False] * len(updates)
+    return [result["error"] is None for result in results]
 
 def main():
     """Main function to run the update process."""
@@ -193,26 +286,52 @@ def main():
         
         success_count = 0
         skip_count = 0
-        for idx, card in enumerate(cards, 1):
-            word = card["fields"]["Word"]["value"]
-            print(f"Processing word {idx}/{total_cards}: {word}")
-            
-            definitions = get_cambridge_definition(word)
-            new_content = format_definition(word, definitions)
-            
-            if new_content is None:
-                print(f"⚠ Skipping word '{word}' - no valid definitions found")
-                skip_count += 1
-                continue
-                
-            existing_content = card["fields"]["Details"]["value"]
-            success = update_card(card["noteId"], existing_content, new_content)
-            
-            if success:
-                success_count += 1
-                print(f"✓ Successfully updated card for word: {word}")
-            else:
-                print(f"✗ Failed to update card for word: {word}")
+        pending = []  # (note_id, word, details) waiting to be flushed
+
+        def flush():
+            nonlocal success_count
+            results = update_cards([(note_id, details) for note_id, _, details in pending])
+            for (_, word, _), success in zip(pending, results):
+                if success:
+                    success_count += 1
+                    print(f"✓ Successfully updated card for word: {word}")
+                else:
+                    print(f"✗ Failed to update card for word: {word}")
+            pending.clear()
+
+        # Group cards by normalized word so each distinct word is fetched and
+        # formatted once; formatting and updates stay sequential
+        cards_by_word: Dict[str, List[int]] = {}
+        for card_idx, card in enumerate(cards):
+            key = card["fields"]["Word"]["value"].strip().lower()
+            cards_by_word.setdefault(key, []).append(card_idx)
+        unique_words = list(cards_by_word)
+        print(f"Fetching definitions for {len(unique_words)} unique words")
+
+        all_definitions = asyncio.run(fetch_definitions(unique_words))
+
+        idx = 0
+        for key, definitions in zip(unique_words, all_definitions):
+            new_content = format_definition(key, definitions)
+
+            for card_idx in cards_by_word[key]:
+                card = cards[card_idx]
+                word = card["fields"]["Word"]["value"]
+                idx += 1
+                print(f"Processing word {idx}/{total_cards}: {word}")
+
+                if new_content is None:
+                    print(f"⚠ Skipping word '{word}' - no valid definitions found")
+                    skip_count += 1
+                    continue
+
+                existing_content = card["fields"]["Details"]["value"]
+                pending.append((card["noteId"], word, existing_content + new_content))
+                if len(pending) >= UPDATE_BATCH_SIZE:
+                    flush()
+
+        if pending:
+            flush()
             
         print(f"\nUpdate complete!")
         print(f"- Successfully updated: {success_count} cards")